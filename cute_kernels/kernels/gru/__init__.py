@@ -62,12 +62,13 @@ class _GRU_Cute(torch.autograd.Function):
             "output": output,
         }
 
+        is_max_seqlen_tensor = isinstance(max_seqlen, torch.Tensor)
+
         if cu_seqlens is None:
             assert max_seqlen is None
             gru_forward_triton(**kwargs)
         else:
             assert max_seqlen is not None
-            is_max_seqlen_tensor = isinstance(max_seqlen, torch.Tensor)
 
             gru_varlen_forward_triton(
                 **kwargs,
@@ -86,10 +87,12 @@ class _GRU_Cute(torch.autograd.Function):
             output,
             input_state,
             cu_seqlens,
-            max_seqlen,
+            max_seqlen if is_max_seqlen_tensor else None,
         )
 
         ctx.gradient_clipping = gradient_clipping
+        # save_for_backward only accepts tensors, so an int max_seqlen is stored on ctx
+        ctx.max_seqlen = None if is_max_seqlen_tensor else max_seqlen
 
         return output
 
@@ -106,7 +109,7 @@ class _GRU_Cute(torch.autograd.Function):
             output,
             input_state,
             cu_seqlens,
-            max_seqlen,
+            max_seqlen_tensor,
         ) = ctx.saved_tensors
 
         input_grad = torch.empty_like(output)
@@ -139,13 +142,11 @@ class _GRU_Cute(torch.autograd.Function):
         if cu_seqlens is None:
             gru_backward_triton(**kwargs)
         else:
-            is_max_seqlen_tensor = isinstance(max_seqlen, torch.Tensor)
-
             gru_varlen_backward_triton(
                 **kwargs,
                 cu_seqlens=cu_seqlens,
-                max_seqlen_tensor=max_seqlen if is_max_seqlen_tensor else None,
-                max_seqlen=None if is_max_seqlen_tensor else max_seqlen,
+                max_seqlen_tensor=max_seqlen_tensor,
+                max_seqlen=ctx.max_seqlen,
             )
 
         weight_grad = weight_grad.type_as(weight)
@@ -2,30 +2,86 @@
 # Copyright (c) 2025, Mayank Mishra
 # **************************************************
 
+from dataclasses import dataclass
+from functools import lru_cache, partial
 from typing import Callable
+from unittest import skipUnless
 
 import torch
 from parameterized import parameterized
 
 from cute_kernels import GRU, KernelBackend, divide_if_divisible, gru_cute, set_seed
+from cute_kernels.utils import get_boolean_env_variable
 
 from ..test_commons import TestCommons
 
 
 _SEED = 42
 
+# bf16 only by default, RUN_FULL_DTYPE_MATRIX=1 also runs fp32 and fp16
+_DTYPES = TestCommons.get_dtypes() if get_boolean_env_variable("RUN_FULL_DTYPE_MATRIX", False) else [torch.bfloat16]
+
+_GRU_CUTE_COMPILED = torch.compile(gru_cute, fullgraph=True, dynamic=False)
+
+
+@dataclass
+class GRUFixture:
+    input_kernel: torch.Tensor
+    input_expected: torch.Tensor
+    weight_kernel: torch.Tensor
+    weight_expected: torch.Tensor
+    forget_input_kernel: torch.Tensor
+    forget_input_expected: torch.Tensor
+    forget_weight_kernel: torch.Tensor
+    forget_weight_expected: torch.Tensor
+    reset_input_kernel: torch.Tensor
+    reset_input_expected: torch.Tensor
+    reset_weight_kernel: torch.Tensor
+    reset_weight_expected: torch.Tensor
+    input_state_kernel: torch.Tensor | None = None
+    input_state_expected: torch.Tensor | None = None
+
+
+def _forward_backward_on_side_streams(
+    *runs: tuple[Callable[[], torch.Tensor], list[torch.Tensor | None]],
+) -> list[torch.Tensor]:
+    # each forward + backward is enqueued on its own stream so that the device work of one overlaps with the host side
+    # launches of the next, autograd runs the backward ops on the stream of their forward ops. cuBLAS doesn't guarantee
+    # the same results across concurrent streams so this is only used for comparisons with tolerances
+    current_stream = torch.cuda.current_stream()
+
+    outputs = []
+    for forward_function, leaves in runs:
+        stream = torch.cuda.Stream()
+        stream.wait_stream(current_stream)
+
+        with torch.cuda.stream(stream):
+            output = forward_function()
+            output.sum().backward()
+
+        current_stream.wait_stream(stream)
+
+        # the output and the gradients are allocated on the side stream but read on the current stream
+        output.record_stream(current_stream)
+        for leaf in leaves:
+            if leaf is not None:
+                leaf.grad.record_stream(current_stream)
+
+        outputs.append(output)
+
+    return outputs
+
 
 class GRUTest(TestCommons):
     @parameterized.expand(
         TestCommons.make_args_matrix(
             [torch.device("cuda")],
-            TestCommons.get_dtypes(),
+            _DTYPES,
             [4],  # batch_size
             [1024],  # sequence_length
             [256],  # state_size
             [4, 256],  # num_heads
             [False, True],  # has_input_state
-            [gru_cute, torch.compile(gru_cute, fullgraph=True)],  # function
         )
     )
     def test_gru(
@@ -37,148 +93,260 @@ class GRUTest(TestCommons):
         state_size: int,
         num_heads: int,
         has_input_state: bool,
-        function: Callable,
     ) -> None:
-        set_seed(_SEED)
+        self._check_gru(
+            device=device,
+            dtype=dtype,
+            batch_size=batch_size,
+            sequence_length=sequence_length,
+            state_size=state_size,
+            num_heads=num_heads,
+            has_input_state=has_input_state,
+            function=gru_cute,
+        )
+
+    def test_gru_torch_compile_smoke(self) -> None:
+        self._check_gru(
+            device=torch.device("cuda"),
+            dtype=torch.bfloat16,
+            batch_size=4,
+            sequence_length=1024,
+            state_size=256,
+            num_heads=4,
+            has_input_state=True,
+            function=_GRU_CUTE_COMPILED,
+        )
 
-        (
-            input_kernel,
-            input_expected,
-            weight_kernel,
-            weight_expected,
-            forget_input_kernel,
-            forget_input_expected,
-            forget_weight_kernel,
-            forget_weight_expected,
-            reset_input_kernel,
-            reset_input_expected,
-            reset_weight_kernel,
-            reset_weight_expected,
-            input_state_kernel,
-            input_state_expected,
-        ) = self._get_packed_tensor_inputs(
+    @parameterized.expand(
+        TestCommons.make_args_matrix(
+            [torch.device("cuda")],
+            _DTYPES,
+            [4],  # batch_size
+            [1024],  # sequence_length
+            [256],  # state_size
+            [4, 256],  # num_heads
+        )
+    )
+    def test_gru_cuda_graph(
+        self,
+        device: torch.device,
+        dtype: torch.dtype,
+        batch_size: int,
+        sequence_length: int,
+        state_size: int,
+        num_heads: int,
+    ) -> None:
+        # forward + backward is captured once and replayed for fresh inputs of the same shape
+        base_tensors = self._generate_base_tensors(
             batch_size=batch_size,
             sequence_length=sequence_length,
             total_tokens=None,
             num_heads=num_heads,
             state_size=state_size,
-            has_input_state=has_input_state,
+            has_input_state=True,
             dtype=dtype,
             device=device,
         )
+        static_inputs = self._clone_base_tensors(base_tensors)
 
-        y_kernel = function(
-            input=input_kernel,
-            weight=weight_kernel,
-            forget_input=forget_input_kernel,
-            forget_weight=forget_weight_kernel,
-            reset_input=reset_input_kernel,
-            reset_weight=reset_weight_kernel,
-            input_state=input_state_kernel,
-        )
+        # eager warmup on a side stream so that autotuning and autograd workspace allocation happen outside capture
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                gru_cute(**static_inputs).sum().backward()
+        torch.cuda.current_stream().wait_stream(stream)
 
-        y_expected = gru_cute(
-            input=input_expected,
-            weight=weight_expected,
-            forget_input=forget_input_expected,
-            forget_weight=forget_weight_expected,
-            reset_input=reset_input_expected,
-            reset_weight=reset_weight_expected,
-            input_state=input_state_expected,
-            kernel_backend=KernelBackend.torch,
-        )
+        for tensor in static_inputs.values():
+            tensor.grad = None
 
-        y_kernel.sum().backward()
-        y_expected.sum().backward()
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            static_output = gru_cute(**static_inputs)
+            static_output.sum().backward()
 
-        self.assert_equal_tensors(
-            y_kernel,
-            y_expected,
-            False,
-            atol_float32=4e-6,
-            rtol_float32=0,
-            atol_float16=6.5e-5,
-            rtol_float16=0,
-            atol_bfloat16=2e-4,
-            rtol_bfloat16=0,
-        )
+        for seed in [_SEED, _SEED + 1]:
+            set_seed(seed)
+            fresh_inputs = {
+                name: (torch.randn_like(tensor) * 0.01).requires_grad_(True) for name, tensor in static_inputs.items()
+            }
 
-        self.assert_equal_tensors(
-            input_kernel.grad,
-            input_expected.grad,
-            False,
-            atol_float32=1.3e-4,
-            rtol_float32=0,
-            atol_float16=3e-3,
-            rtol_float16=0,
-            atol_bfloat16=1.6e-2,
-            rtol_bfloat16=0,
-        )
+            with torch.no_grad():
+                for name, tensor in static_inputs.items():
+                    tensor.copy_(fresh_inputs[name])
 
-        self.assert_equal_tensors(
-            forget_input_kernel.grad,
-            forget_input_expected.grad,
-            False,
-            atol_float32=2.5e-6,
-            rtol_float32=0,
-            atol_float16=5.4e-5,
-            rtol_float16=0,
-            atol_bfloat16=4e-4,
-            rtol_bfloat16=0,
-        )
+            graph.replay()
 
-        self.assert_equal_tensors(
-            reset_input_kernel.grad,
-            reset_input_expected.grad,
-            False,
-            atol_float32=1.3e-6,
-            rtol_float32=0,
-            atol_float16=2e-6,
-            rtol_float16=0,
-            atol_bfloat16=1.2e-5,
-            rtol_bfloat16=0,
-        )
+            y_expected = gru_cute(**fresh_inputs)
+            y_expected.sum().backward()
 
-        self.assert_equal_tensors(
-            weight_kernel.grad,
-            weight_expected.grad,
-            False,
-            atol_float32=1e-3,
-            rtol_float32=1e-3,
-            atol_float16=1.3e-2,
-            rtol_float16=0,
-            atol_bfloat16=7.5e-2,
-            rtol_bfloat16=0,
+            self.assert_equal_tensors(static_output, y_expected, False)
+            for name, tensor in static_inputs.items():
+                self.assert_equal_tensors(tensor.grad, fresh_inputs[name].grad, False)
+
+    def _check_gru(
+        self,
+        device: torch.device,
+        dtype: torch.dtype,
+        batch_size: int,
+        sequence_length: int,
+        state_size: int,
+        num_heads: int,
+        has_input_state: bool,
+        function: Callable,
+    ) -> None:
+        set_seed(_SEED)
+
+        inputs = self._get_packed_tensor_inputs(
+            batch_size=batch_size,
+            sequence_length=sequence_length,
+            total_tokens=None,
+            num_heads=num_heads,
+            state_size=state_size,
+            has_input_state=has_input_state,
+            dtype=dtype,
+            device=device,
         )
 
-        self.assert_equal_tensors(
-            forget_weight_kernel.grad,
-            forget_weight_expected.grad,
-            False,
-            atol_float32=6.3e-5,
-            rtol_float32=0,
-            atol_float16=1e-3,
-            rtol_float16=0,
-            atol_bfloat16=1.6e-2,
-            rtol_bfloat16=0,
+        y_kernel, y_expected = _forward_backward_on_side_streams(
+            (
+                partial(
+                    function,
+                    input=inputs.input_kernel,
+                    weight=inputs.weight_kernel,
+                    forget_input=inputs.forget_input_kernel,
+                    forget_weight=inputs.forget_weight_kernel,
+                    reset_input=inputs.reset_input_kernel,
+                    reset_weight=inputs.reset_weight_kernel,
+                    input_state=inputs.input_state_kernel,
+                ),
+                [
+                    inputs.input_kernel,
+                    inputs.weight_kernel,
+                    inputs.forget_input_kernel,
+                    inputs.forget_weight_kernel,
+                    inputs.reset_input_kernel,
+                    inputs.reset_weight_kernel,
+                    inputs.input_state_kernel,
+                ],
+            ),
+            (
+                partial(
+                    gru_cute,
+                    input=inputs.input_expected,
+                    weight=inputs.weight_expected,
+                    forget_input=inputs.forget_input_expected,
+                    forget_weight=inputs.forget_weight_expected,
+                    reset_input=inputs.reset_input_expected,
+                    reset_weight=inputs.reset_weight_expected,
+                    input_state=inputs.input_state_expected,
+                    kernel_backend=KernelBackend.torch,
+                ),
+                [
+                    inputs.input_expected,
+                    inputs.weight_expected,
+                    inputs.forget_input_expected,
+                    inputs.forget_weight_expected,
+                    inputs.reset_input_expected,
+                    inputs.reset_weight_expected,
+                    inputs.input_state_expected,
+                ],
+            ),
         )
 
-        self.assert_equal_tensors(
-            reset_weight_kernel.grad,
-            reset_weight_expected.grad,
-            False,
-            atol_float32=1.41e-5,
-            rtol_float32=1e-10,
-            atol_float16=8.4e-5,
-            rtol_float16=0,
-            atol_bfloat16=2.8e-3,
-            rtol_bfloat16=0,
+        self.assert_equal_tensors_batch(
+            [
+                (
+                    y_kernel,
+                    y_expected,
+                    {
+                        "atol_float32": 4e-6,
+                        "rtol_float32": 0,
+                        "atol_float16": 6.5e-5,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 2e-4,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.input_kernel.grad,
+                    inputs.input_expected.grad,
+                    {
+                        "atol_float32": 1.3e-4,
+                        "rtol_float32": 0,
+                        "atol_float16": 3e-3,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 1.6e-2,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.forget_input_kernel.grad,
+                    inputs.forget_input_expected.grad,
+                    {
+                        "atol_float32": 2.5e-6,
+                        "rtol_float32": 0,
+                        "atol_float16": 5.4e-5,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 4e-4,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.reset_input_kernel.grad,
+                    inputs.reset_input_expected.grad,
+                    {
+                        "atol_float32": 1.3e-6,
+                        "rtol_float32": 0,
+                        "atol_float16": 2e-6,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 1.2e-5,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.weight_kernel.grad,
+                    inputs.weight_expected.grad,
+                    {
+                        "atol_float32": 1e-3,
+                        "rtol_float32": 1e-3,
+                        "atol_float16": 1.3e-2,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 7.5e-2,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.forget_weight_kernel.grad,
+                    inputs.forget_weight_expected.grad,
+                    {
+                        "atol_float32": 6.3e-5,
+                        "rtol_float32": 0,
+                        "atol_float16": 1e-3,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 1.6e-2,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.reset_weight_kernel.grad,
+                    inputs.reset_weight_expected.grad,
+                    {
+                        "atol_float32": 1.41e-5,
+                        "rtol_float32": 1e-10,
+                        "atol_float16": 8.4e-5,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 2.8e-3,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+            ]
         )
 
     @parameterized.expand(
         TestCommons.make_args_matrix(
             [torch.device("cuda")],
-            TestCommons.get_dtypes(),
+            _DTYPES,
             [[0, 7, 19, 27, 93]],  # cu_seqlens
             [256],  # state_size
             [4],  # num_heads
@@ -193,32 +361,71 @@ class GRUTest(TestCommons):
         state_size: int,
         num_heads: int,
         has_input_state: bool,
+    ) -> None:
+        # two identical packed runs check determinism, the cross-check against per sequence calls is in
+        # test_gru_varlen_reference_loop
+        self._check_gru_varlen_torch(
+            device=device,
+            dtype=dtype,
+            cu_seqlens=cu_seqlens,
+            state_size=state_size,
+            num_heads=num_heads,
+            has_input_state=has_input_state,
+            reference_function=None,
+        )
+
+    @parameterized.expand(
+        TestCommons.make_args_matrix(
+            [torch.device("cuda")],
+            _DTYPES,
+            [[0, 7, 19, 27, 93]],  # cu_seqlens
+            [256],  # state_size
+            [4],  # num_heads
+            [False, True],  # has_input_state
+        )
+    )
+    @skipUnless(get_boolean_env_variable("SLOW_TESTS", False), "set SLOW_TESTS=1 to run")
+    def test_gru_varlen_reference_loop(
+        self,
+        device: torch.device,
+        dtype: torch.dtype,
+        cu_seqlens: list[int],
+        state_size: int,
+        num_heads: int,
+        has_input_state: bool,
+    ) -> None:
+        self._check_gru_varlen_torch(
+            device=device,
+            dtype=dtype,
+            cu_seqlens=cu_seqlens,
+            state_size=state_size,
+            num_heads=num_heads,
+            has_input_state=has_input_state,
+            reference_function=self._gru_per_sequence_reference,
+        )
+
+    def _check_gru_varlen_torch(
+        self,
+        device: torch.device,
+        dtype: torch.dtype,
+        cu_seqlens: list[int],
+        state_size: int,
+        num_heads: int,
+        has_input_state: bool,
+        reference_function: Callable[[GRUFixture, list[int]], torch.Tensor] | None,
     ) -> None:
         set_seed(_SEED)
 
+        # computed on the host from the list so that shape construction doesn't sync with the device
         batch_size = len(cu_seqlens) - 1
-        cu_seqlens = torch.tensor(cu_seqlens, device=device)
-        max_seqlen = (cu_seqlens[1:] - cu_seqlens[:-1]).max()
-
-        (
-            input_packed_kernel,
-            input_packed_expected,
-            weight_kernel,
-            weight_expected,
-            forget_input_packed_kernel,
-            forget_input_packed_expected,
-            forget_weight_kernel,
-            forget_weight_expected,
-            reset_input_packed_kernel,
-            reset_input_packed_expected,
-            reset_weight_kernel,
-            reset_weight_expected,
-            input_state_kernel,
-            input_state_expected,
-        ) = self._get_packed_tensor_inputs(
+        total_tokens = cu_seqlens[-1]
+        max_seqlen = max(end - start for start, end in zip(cu_seqlens, cu_seqlens[1:]))
+        cu_seqlens_tensor = torch.tensor(cu_seqlens, pin_memory=True).to(device, non_blocking=True)
+
+        inputs = self._get_packed_tensor_inputs(
             batch_size=batch_size,
             sequence_length=None,
-            total_tokens=cu_seqlens[-1],
+            total_tokens=total_tokens,
             num_heads=num_heads,
             state_size=state_size,
             has_input_state=has_input_state,
@@ -226,83 +433,95 @@ class GRUTest(TestCommons):
             device=device,
         )
 
-        y_kernel = gru_cute(
-            input=input_packed_kernel,
-            weight=weight_kernel,
-            forget_input=forget_input_packed_kernel,
-            forget_weight=forget_weight_kernel,
-            reset_input=reset_input_packed_kernel,
-            reset_weight=reset_weight_kernel,
-            input_state=input_state_kernel,
-            cu_seqlens=cu_seqlens,
-            max_seqlen=max_seqlen,
-            kernel_backend=KernelBackend.torch,
-        )
+        packed_kwargs = {
+            "cu_seqlens": cu_seqlens_tensor,
+            "max_seqlen": max_seqlen,
+            "kernel_backend": KernelBackend.torch,
+        }
 
-        y_expected = []
-        for i in range(batch_size):
-            y = gru_cute(
-                input=input_packed_expected[cu_seqlens[i] : cu_seqlens[i + 1]].unsqueeze(0),
-                weight=weight_expected,
-                forget_input=forget_input_packed_expected[cu_seqlens[i] : cu_seqlens[i + 1]].unsqueeze(0),
-                forget_weight=forget_weight_expected,
-                reset_input=reset_input_packed_expected[cu_seqlens[i] : cu_seqlens[i + 1]].unsqueeze(0),
-                reset_weight=reset_weight_expected,
-                input_state=input_state_expected[i].unsqueeze(0) if has_input_state else None,
-                kernel_backend=KernelBackend.torch,
-            ).squeeze(0)
-            y_expected.append(y)
-        y_expected = torch.cat(y_expected)
+        y_kernel = gru_cute(
+            input=inputs.input_kernel,
+            weight=inputs.weight_kernel,
+            forget_input=inputs.forget_input_kernel,
+            forget_weight=inputs.forget_weight_kernel,
+            reset_input=inputs.reset_input_kernel,
+            reset_weight=inputs.reset_weight_kernel,
+            input_state=inputs.input_state_kernel,
+            **packed_kwargs,
+        )
+
+        if reference_function is None:
+            y_expected = gru_cute(
+                input=inputs.input_expected,
+                weight=inputs.weight_expected,
+                forget_input=inputs.forget_input_expected,
+                forget_weight=inputs.forget_weight_expected,
+                reset_input=inputs.reset_input_expected,
+                reset_weight=inputs.reset_weight_expected,
+                input_state=inputs.input_state_expected,
+                **packed_kwargs,
+            )
+        else:
+            y_expected = reference_function(inputs, cu_seqlens)
 
         y_kernel.sum().backward()
         y_expected.sum().backward()
 
-        self.assert_equal_tensors(y_kernel, y_expected, False)
-
-        self.assert_equal_tensors(input_packed_kernel.grad, input_packed_expected.grad, False)
-        self.assert_equal_tensors(forget_input_packed_kernel.grad, forget_input_packed_expected.grad, False)
-        self.assert_equal_tensors(reset_input_packed_kernel.grad, reset_input_packed_expected.grad, False)
-
-        self.assert_equal_tensors(
-            weight_kernel.grad,
-            weight_expected.grad,
-            False,
-            atol_float32=1.5e-7,
-            rtol_float32=0,
-            atol_float16=1.5e-3,
-            rtol_float16=0,
-            atol_bfloat16=6e-3,
-            rtol_bfloat16=0,
-        )
-
-        self.assert_equal_tensors(
-            forget_weight_kernel.grad,
-            forget_weight_expected.grad,
-            False,
-            atol_float32=1.5e-7,
-            rtol_float32=0,
-            atol_float16=1.5e-3,
-            rtol_float16=0,
-            atol_bfloat16=6e-3,
-            rtol_bfloat16=0,
-        )
+        # the same packed computation run twice on the same stream has to match exactly
+        exact_match = reference_function is None
+        # the tolerances only apply to the comparison against the per sequence reference
+        weight_grad_tolerances = (
+            {}
+            if exact_match
+            else {
+                "atol_float32": 1.5e-7,
+                "rtol_float32": 0,
+                "atol_float16": 1.5e-3,
+                "rtol_float16": 0,
+                "atol_bfloat16": 6e-3,
+                "rtol_bfloat16": 0,
+            }
+        )
+
+        self.assert_equal_tensors(y_kernel, y_expected, exact_match)
+
+        self.assert_equal_tensors(inputs.input_kernel.grad, inputs.input_expected.grad, exact_match)
+        self.assert_equal_tensors(inputs.forget_input_kernel.grad, inputs.forget_input_expected.grad, exact_match)
+        self.assert_equal_tensors(inputs.reset_input_kernel.grad, inputs.reset_input_expected.grad, exact_match)
+
+        for weight_grad_kernel, weight_grad_expected in [
+            (inputs.weight_kernel.grad, inputs.weight_expected.grad),
+            (inputs.forget_weight_kernel.grad, inputs.forget_weight_expected.grad),
+            (inputs.reset_weight_kernel.grad, inputs.reset_weight_expected.grad),
+        ]:
+            self.assert_equal_tensors(weight_grad_kernel, weight_grad_expected, exact_match, **weight_grad_tolerances)
+
+    @staticmethod
+    def _gru_per_sequence_reference(inputs: GRUFixture, cu_seqlens: list[int]) -> torch.Tensor:
+        # runs gru_cute separately on every sequence
+        y = []
+        for i, (start, end) in enumerate(zip(cu_seqlens, cu_seqlens[1:])):
+            y.append(
+                gru_cute(
+                    input=inputs.input_expected[start:end].unsqueeze(0),
+                    weight=inputs.weight_expected,
+                    forget_input=inputs.forget_input_expected[start:end].unsqueeze(0),
+                    forget_weight=inputs.forget_weight_expected,
+                    reset_input=inputs.reset_input_expected[start:end].unsqueeze(0),
+                    reset_weight=inputs.reset_weight_expected,
+                    input_state=(
+                        None if inputs.input_state_expected is None else inputs.input_state_expected[i].unsqueeze(0)
+                    ),
+                    kernel_backend=KernelBackend.torch,
+                ).squeeze(0)
+            )
 
-        self.assert_equal_tensors(
-            reset_weight_kernel.grad,
-            reset_weight_expected.grad,
-            False,
-            atol_float32=1.5e-7,
-            rtol_float32=0,
-            atol_float16=1.5e-3,
-            rtol_float16=0,
-            atol_bfloat16=6e-3,
-            rtol_bfloat16=0,
-        )
+        return torch.cat(y)
 
     @parameterized.expand(
         TestCommons.make_args_matrix(
             [torch.device("cuda")],
-            TestCommons.get_dtypes(),
+            _DTYPES,
             [[0, 7, 19, 27, 93]],  # cu_seqlens
             [256],  # state_size
             [4],  # num_heads
@@ -321,28 +540,14 @@ class GRUTest(TestCommons):
         set_seed(_SEED)
 
         batch_size = len(cu_seqlens) - 1
-        cu_seqlens = torch.tensor(cu_seqlens, device=device)
-        max_seqlen = (cu_seqlens[1:] - cu_seqlens[:-1]).max()
-
-        (
-            input_kernel,
-            input_expected,
-            weight_kernel,
-            weight_expected,
-            forget_input_kernel,
-            forget_input_expected,
-            forget_weight_kernel,
-            forget_weight_expected,
-            reset_input_kernel,
-            reset_input_expected,
-            reset_weight_kernel,
-            reset_weight_expected,
-            input_state_kernel,
-            input_state_expected,
-        ) = self._get_packed_tensor_inputs(
+        total_tokens = cu_seqlens[-1]
+        max_seqlen = max(end - start for start, end in zip(cu_seqlens, cu_seqlens[1:]))
+        cu_seqlens = torch.tensor(cu_seqlens, pin_memory=True).to(device, non_blocking=True)
+
+        inputs = self._get_packed_tensor_inputs(
             batch_size=batch_size,
             sequence_length=None,
-            total_tokens=cu_seqlens[-1],
+            total_tokens=total_tokens,
             num_heads=num_heads,
             state_size=state_size,
             has_input_state=has_input_state,
@@ -351,25 +556,25 @@ class GRUTest(TestCommons):
         )
 
         y_kernel = gru_cute(
-            input=input_kernel,
-            weight=weight_kernel,
-            forget_input=forget_input_kernel,
-            forget_weight=forget_weight_kernel,
-            reset_input=reset_input_kernel,
-            reset_weight=reset_weight_kernel,
-            input_state=input_state_kernel,
+            input=inputs.input_kernel,
+            weight=inputs.weight_kernel,
+            forget_input=inputs.forget_input_kernel,
+            forget_weight=inputs.forget_weight_kernel,
+            reset_input=inputs.reset_input_kernel,
+            reset_weight=inputs.reset_weight_kernel,
+            input_state=inputs.input_state_kernel,
             cu_seqlens=cu_seqlens,
             max_seqlen=max_seqlen,
         )
 
         y_expected = gru_cute(
-            input=input_expected,
-            weight=weight_expected,
-            forget_input=forget_input_expected,
-            forget_weight=forget_weight_expected,
-            reset_input=reset_input_expected,
-            reset_weight=reset_weight_expected,
-            input_state=input_state_expected,
+            input=inputs.input_expected,
+            weight=inputs.weight_expected,
+            forget_input=inputs.forget_input_expected,
+            forget_weight=inputs.forget_weight_expected,
+            reset_input=inputs.reset_input_expected,
+            reset_weight=inputs.reset_weight_expected,
+            input_state=inputs.input_state_expected,
             cu_seqlens=cu_seqlens,
             max_seqlen=max_seqlen,
             kernel_backend=KernelBackend.torch,
@@ -378,96 +583,97 @@ class GRUTest(TestCommons):
         y_kernel.sum().backward()
         y_expected.sum().backward()
 
-        self.assert_equal_tensors(
-            y_kernel,
-            y_expected,
-            False,
-            atol_float32=3e-6,
-            rtol_float32=0,
-            atol_float16=6.5e-5,
-            rtol_float16=0,
-            atol_bfloat16=1.5e-4,
-            rtol_bfloat16=0,
-        )
-
-        self.assert_equal_tensors(
-            input_kernel.grad,
-            input_expected.grad,
-            False,
-            atol_float32=1.3e-4,
-            rtol_float32=0,
-            atol_float16=3e-3,
-            rtol_float16=0,
-            atol_bfloat16=8e-3,
-            rtol_bfloat16=0,
-        )
-
-        self.assert_equal_tensors(
-            forget_input_kernel.grad,
-            forget_input_expected.grad,
-            False,
-            atol_float32=2e-6,
-            rtol_float32=0,
-            atol_float16=3.1e-5,
-            rtol_float16=0,
-            atol_bfloat16=2e-4,
-            rtol_bfloat16=0,
-        )
-
-        self.assert_equal_tensors(
-            reset_input_kernel.grad,
-            reset_input_expected.grad,
-            False,
-            atol_float32=1.1e-6,
-            rtol_float32=0,
-            atol_float16=1.5e-5,
-            rtol_float16=0,
-            atol_bfloat16=1.6e-5,
-            rtol_bfloat16=0,
-        )
-
-        self.assert_equal_tensors(
-            weight_kernel.grad,
-            weight_expected.grad,
-            False,
-            atol_float32=1.6e-4,
-            rtol_float32=0,
-            atol_float16=3.7e-4,
-            rtol_float16=0,
-            atol_bfloat16=2.5e-3,
-            rtol_bfloat16=0,
-        )
-
-        print((forget_weight_kernel.grad - forget_weight_expected.grad).abs().max().item(), input_kernel.grad.dtype)
-
-        self.assert_equal_tensors(
-            forget_weight_kernel.grad,
-            forget_weight_expected.grad,
-            False,
-            atol_float32=2.7e-6,
-            rtol_float32=0,
-            atol_float16=3.9e-6,
-            rtol_float16=0,
-            atol_bfloat16=3.1e-5,
-            rtol_bfloat16=0,
-        )
-
-        print((reset_weight_kernel.grad - reset_weight_expected.grad).abs().max().item(), input_kernel.grad.dtype)
-
-        self.assert_equal_tensors(
-            reset_weight_kernel.grad,
-            reset_weight_expected.grad,
-            False,
-            atol_float32=2.3e-6,
-            rtol_float32=0,
-            atol_float16=3.9e-6,
-            rtol_float16=0,
+        self.assert_equal_tensors_batch(
+            [
+                (
+                    y_kernel,
+                    y_expected,
+                    {
+                        "atol_float32": 3e-6,
+                        "rtol_float32": 0,
+                        "atol_float16": 6.5e-5,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 1.5e-4,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.input_kernel.grad,
+                    inputs.input_expected.grad,
+                    {
+                        "atol_float32": 1.3e-4,
+                        "rtol_float32": 0,
+                        "atol_float16": 3e-3,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 8e-3,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.forget_input_kernel.grad,
+                    inputs.forget_input_expected.grad,
+                    {
+                        "atol_float32": 2e-6,
+                        "rtol_float32": 0,
+                        "atol_float16": 3.1e-5,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 2e-4,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.reset_input_kernel.grad,
+                    inputs.reset_input_expected.grad,
+                    {
+                        "atol_float32": 1.1e-6,
+                        "rtol_float32": 0,
+                        "atol_float16": 1.5e-5,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 1.6e-5,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.weight_kernel.grad,
+                    inputs.weight_expected.grad,
+                    {
+                        "atol_float32": 1.6e-4,
+                        "rtol_float32": 0,
+                        "atol_float16": 3.7e-4,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 2.5e-3,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.forget_weight_kernel.grad,
+                    inputs.forget_weight_expected.grad,
+                    {
+                        "atol_float32": 2.7e-6,
+                        "rtol_float32": 0,
+                        "atol_float16": 3.9e-6,
+                        "rtol_float16": 0,
+                        "atol_bfloat16": 3.1e-5,
+                        "rtol_bfloat16": 0,
+                    },
+                ),
+                (
+                    inputs.reset_weight_kernel.grad,
+                    inputs.reset_weight_expected.grad,
+                    {
+                        "atol_float32": 2.3e-6,
+                        "rtol_float32": 0,
+                        "atol_float16": 3.9e-6,
+                        "rtol_float16": 0,
+                    },
+                ),
+            ]
         )
 
     @parameterized.expand(
         TestCommons.make_args_matrix(
             [torch.device("cuda")],
-            TestCommons.get_dtypes(),
+            _DTYPES,
             [[0, 7, 19, 27, 93], None],  # cu_seqlens
             [256],  # state_size
             [4],  # num_heads
@@ -484,17 +690,20 @@ class GRUTest(TestCommons):
         input_size = 79
         output_size = 93
 
-        gru = GRU(
+        gru = self._build_gru(
             input_size=input_size,
             state_size=state_size,
             output_size=output_size,
             num_heads=num_heads,
-            add_bias=False,
-            gradient_clipping=None,
-        ).to(device, dtype)
+            dtype=dtype,
+            device=device,
+        )
+        gru.zero_grad(set_to_none=True)
 
         batch_size = 4 if cu_seqlens is None else len(cu_seqlens) - 1
-        cu_seqlens = None if cu_seqlens is None else torch.tensor(cu_seqlens, device=device)
+        cu_seqlens = (
+            None if cu_seqlens is None else torch.tensor(cu_seqlens, pin_memory=True).to(device, non_blocking=True)
+        )
         max_seqlen = None if cu_seqlens is None else (cu_seqlens[1:] - cu_seqlens[:-1]).max()
 
         input = (
@@ -513,8 +722,37 @@ class GRUTest(TestCommons):
         assert output.size() == (*input.size()[:-1], output_size)
         assert output_state.size() == input_state.size()
 
-    def _get_packed_tensor_inputs(
-        self,
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._generate_base_tensors.cache_clear()
+        cls._build_gru.cache_clear()
+        torch.cuda.empty_cache()
+
+        super().tearDownClass()
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _build_gru(
+        input_size: int,
+        state_size: int,
+        output_size: int,
+        num_heads: int,
+        dtype: torch.dtype,
+        device: torch.device,
+    ) -> GRU:
+        # shared by the rows that only differ in the input, callers should clear the grads before use
+        return GRU(
+            input_size=input_size,
+            state_size=state_size,
+            output_size=output_size,
+            num_heads=num_heads,
+            add_bias=False,
+            gradient_clipping=None,
+        ).to(device, dtype)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _generate_base_tensors(
         batch_size: int,
         sequence_length: int | None,
         total_tokens: int | None,
@@ -523,76 +761,70 @@ class GRUTest(TestCommons):
         has_input_state: bool,
         dtype: torch.dtype,
         device: torch.device,
-    ) -> tuple[torch.Tensor | None]:
-        head_dim = divide_if_divisible(state_size, num_heads)
+    ) -> dict[str, torch.Tensor | None]:
+        # tensors hash by id, so a tensor length would never hit the cache and would pin its buffers until teardown
+        for length in (batch_size, sequence_length, total_tokens):
+            assert length is None or isinstance(length, int), "lengths used as cache keys should be python ints"
 
-        input_kernel, input_expected = self.get_random_duplicated_tensors(
-            (
-                (batch_size, sequence_length, num_heads, head_dim)
-                if total_tokens is None
-                else (total_tokens, num_heads, head_dim)
-            ),
-            device=device,
-            dtype=dtype,
-            std=0.01,
-        )
+        # seeded here so the cached tensors don't depend on which test populated the cache first
+        set_seed(_SEED)
 
-        weight_kernel, weight_expected = self.get_random_duplicated_tensors(
-            (num_heads, head_dim, head_dim), device=device, dtype=dtype, std=0.01
-        )
+        head_dim = divide_if_divisible(state_size, num_heads)
+        input_size = (
+            (batch_size, sequence_length, num_heads, head_dim)
+            if total_tokens is None
+            else (total_tokens, num_heads, head_dim)
+        )
+        weight_size = (num_heads, head_dim, head_dim)
+
+        # one draw per tensor in this order, the test tolerances were fitted to these values for _SEED
+        sizes = {
+            "input": input_size,
+            "weight": weight_size,
+            "forget_input": input_size,
+            "forget_weight": weight_size,
+            "reset_input": input_size,
+            "reset_weight": weight_size,
+            "input_state": (batch_size, num_heads, head_dim) if has_input_state else None,
+        }
+
+        return {
+            name: None if size is None else torch.randn(size, device=device, dtype=dtype) * 0.01
+            for name, size in sizes.items()
+        }
+
+    @staticmethod
+    def _clone_base_tensors(tensors: dict[str, torch.Tensor | None]) -> dict[str, torch.Tensor | None]:
+        return {
+            name: None if tensor is None else tensor.clone().requires_grad_(True) for name, tensor in tensors.items()
+        }
 
-        # forget
-        forget_input_kernel, forget_input_expected = self.get_random_duplicated_tensors(
-            (
-                (batch_size, sequence_length, num_heads, head_dim)
-                if total_tokens is None
-                else (total_tokens, num_heads, head_dim)
-            ),
-            device=device,
+    def _get_packed_tensor_inputs(
+        self,
+        batch_size: int,
+        sequence_length: int | None,
+        total_tokens: int | None,
+        num_heads: int,
+        state_size: int,
+        has_input_state: bool,
+        dtype: torch.dtype,
+        device: torch.device,
+    ) -> GRUFixture:
+        base_tensors = self._generate_base_tensors(
+            batch_size=batch_size,
+            sequence_length=sequence_length,
+            total_tokens=total_tokens,
+            num_heads=num_heads,
+            state_size=state_size,
+            has_input_state=has_input_state,
             dtype=dtype,
-            std=0.01,
-        )
-
-        forget_weight_kernel, forget_weight_expected = self.get_random_duplicated_tensors(
-            (num_heads, head_dim, head_dim), device=device, dtype=dtype, std=0.01
-        )
-
-        # reset
-        reset_input_kernel, reset_input_expected = self.get_random_duplicated_tensors(
-            (
-                (batch_size, sequence_length, num_heads, head_dim)
-                if total_tokens is None
-                else (total_tokens, num_heads, head_dim)
-            ),
             device=device,
-            dtype=dtype,
-            std=0.01,
         )
 
-        reset_weight_kernel, reset_weight_expected = self.get_random_duplicated_tensors(
-            (num_heads, head_dim, head_dim), device=device, dtype=dtype, std=0.01
-        )
-
-        input_state_kernel = None
-        input_state_expected = None
-        if has_input_state:
-            input_state_kernel, input_state_expected = self.get_random_duplicated_tensors(
-                (batch_size, num_heads, head_dim), device=device, dtype=dtype, std=0.01
-            )
+        tensors_kernel = self._clone_base_tensors(base_tensors)
+        tensors_expected = self._clone_base_tensors(base_tensors)
 
-        return (
-            input_kernel,
-            input_expected,
-            weight_kernel,
-            weight_expected,
-            forget_input_kernel,
-            forget_input_expected,
-            forget_weight_kernel,
-            forget_weight_expected,
-            reset_input_kernel,
-            reset_input_expected,
-            reset_weight_kernel,
-            reset_weight_expected,
-            input_state_kernel,
-            input_state_expected,
+        return GRUFixture(
+            **{f"{name}_kernel": tensor for name, tensor in tensors_kernel.items()},
+            **{f"{name}_expected": tensor for name, tensor in tensors_expected.items()},
         )
@@ -14,6 +14,16 @@ from torch.testing import assert_close
 from cute_kernels import init_inductor
 
 
+# (rtol, atol) used by torch.testing.assert_close when no tolerances are passed
+_DEFAULT_TOLERANCES = {
+    torch.float32: (1.3e-6, 1e-5),
+    torch.float16: (1e-3, 1e-5),
+    torch.bfloat16: (1.6e-2, 1e-5),
+}
+
+_TOLERANCE_KEYS = {f"{kind}_{dtype}" for kind in ["rtol", "atol"] for dtype in ["float32", "float16", "bfloat16"]}
+
+
 class TestCommons(TestCase):
     def setUp(self) -> None:
         return init_inductor(cache_size_limit=1024)
@@ -73,15 +83,57 @@ class TestCommons(TestCase):
             assert x.dtype == y.dtype
             dtype = x.dtype
 
-            if dtype == torch.float32:
-                assert_close(x, y, rtol=rtol_float32, atol=atol_float32)
-            elif dtype == torch.float16:
-                assert_close(x, y, rtol=rtol_float16, atol=atol_float16)
-            elif dtype == torch.bfloat16:
-                assert_close(x, y, rtol=rtol_bfloat16, atol=atol_bfloat16)
-            else:
+            tolerances = {
+                torch.float32: (rtol_float32, atol_float32),
+                torch.float16: (rtol_float16, atol_float16),
+                torch.bfloat16: (rtol_bfloat16, atol_bfloat16),
+            }
+
+            if dtype not in tolerances:
+                raise ValueError(f"unexpected dtype ({dtype})")
+
+            rtol, atol = tolerances[dtype]
+            assert_close(x, y, rtol=rtol, atol=atol)
+
+    def assert_equal_tensors_batch(self, tensors: list[tuple[torch.Tensor, torch.Tensor, dict]]) -> None:
+        # same check as assert_equal_tensors with exact_match=False for a list of (x, y, tolerances), the per tensor
+        # max violations are stacked on device so that a single copy to the host checks the whole list
+        max_violations = []
+
+        for x, y, tolerances in tensors:
+            assert x.dtype == y.dtype
+            assert x.size() == y.size()
+
+            dtype = x.dtype
+            if dtype not in _DEFAULT_TOLERANCES:
                 raise ValueError(f"unexpected dtype ({dtype})")
 
+            unknown_keys = set(tolerances) - _TOLERANCE_KEYS
+            assert len(unknown_keys) == 0, f"unexpected tolerance keys ({unknown_keys})"
+
+            name = str(dtype).split(".")[-1]
+            default_rtol, default_atol = _DEFAULT_TOLERANCES[dtype]
+            rtol = tolerances.get(f"rtol_{name}")
+            atol = tolerances.get(f"atol_{name}")
+            assert (rtol is None) == (atol is None), "both or neither of rtol and atol should be specified"
+
+            if rtol is None:
+                rtol, atol = default_rtol, default_atol
+
+            x = x.float()
+            y = y.float()
+
+            violation = (x - y).abs() - atol - rtol * y.abs()
+            # equal values (including equal infinities which give NaN above) pass, same as assert_close
+            violation = violation.masked_fill(x == y, 0)
+            max_violations.append(violation.amax())
+
+        max_violations = torch.stack(max_violations)
+
+        for i, max_violation in enumerate(max_violations.cpu().tolist()):
+            # NaN violations fail the comparison as well
+            assert max_violation <= 0, f"tensors at index {i} are not close (max violation = {max_violation})"
+
     def get_activation_function(self, is_glu: bool) -> nn.Module:
         return nn.GLU() if is_glu else nn.GELU(approximate="tanh")
 